@@ -1,6 +1,11 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
+import csv
+import io
+import json
+import time
 import uvicorn
 
 from datastore import DataStore
@@ -38,7 +43,14 @@ def submit_attempt(a: AttemptIn):
         pass
     attempt = a.dict()
     decision = engine.process_attempt(a.student_id, attempt)
-    return decision
+    return decision.to_dict()
+
+@app.post("/attempts")
+def submit_attempts(batch: List[AttemptIn]):
+    # bulk upload (e.g. end-of-week sync): one request, one timestamp, attempts applied in order
+    now = time.time_ns()
+    decisions = [engine.process_attempt(a.student_id, a.dict(), now).to_dict() for a in batch]
+    return {"decisions": decisions}
 
 @app.get("/profile/{student_id}")
 def get_profile(student_id: str):
@@ -50,6 +62,47 @@ def induce_rules(student_ids: Optional[str] = None):
     proposals = engine.induce_candidate_rules(sids)
     return {"candidate_rules": proposals}
 
+# weekly export: one row per student, streamed so memory stays flat for large cohorts
+# recent_attempts counts the retained history, capped at DataStore.max_attempts_per_student
+EXPORT_FIELDS = ['student_id', 'level', 'xp', 'recent_attempts', 'weak_topics']
+
+def _export_rows():
+    for sid, profile in list(ds.profiles.items()):
+        yield {
+            'student_id': sid,
+            'level': profile['level'],
+            'xp': profile['xp'],
+            'recent_attempts': len(ds.attempts.get(sid, ())),
+            'weak_topics': list(profile['weak_topics']),
+        }
+
+def _iter_jsonl():
+    for row in _export_rows():
+        yield json.dumps(row) + "\n"
+
+def _iter_csv():
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+    # header goes out even when there are no students yet
+    writer.writeheader()
+    yield buf.getvalue()
+    buf.seek(0)
+    buf.truncate(0)
+    for row in _export_rows():
+        row['weak_topics'] = ";".join(row['weak_topics'])
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+
+@app.get("/export/weekly.jsonl")
+def export_weekly_jsonl():
+    return StreamingResponse(_iter_jsonl(), media_type="application/x-ndjson")
+
+@app.get("/export/weekly.csv")
+def export_weekly_csv():
+    return StreamingResponse(_iter_csv(), media_type="text/csv")
+
 # If running as script
 if __name__ == "__main__":
     uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
@@ -1,42 +1,110 @@
 # Simple in-memory datastore for prototype (replace with DB for production)
-from collections import defaultdict
-from datetime import datetime
-from typing import Dict, List
+import sys
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, Optional
+
+_EPOCH = datetime(1970, 1, 1)
+
+def ts_to_datetime(ts_ns: int) -> datetime:
+    # naive UTC datetime for an epoch-nanoseconds timestamp (same shape as datetime.utcnow())
+    return _EPOCH + timedelta(microseconds=ts_ns // 1000)
+
+# difficulty ladder, lowest first; a difficulty's rank is its position here
+DIFFICULTY_ORDER = ('easy', 'medium', 'hard')
+DIFFICULTY_RANK = {d: i for i, d in enumerate(DIFFICULTY_ORDER)}
+
+# compact per-attempt outcome code: difficulty rank * 2 + correct; unknown difficulties rank 3
+def outcome_code(difficulty: str, correct: bool) -> int:
+    return DIFFICULTY_RANK.get(difficulty, 3) << 1 | bool(correct)
+
+def _new_profile() -> dict:
+    return {
+        'xp': 0,
+        'level': 1,
+        'weak_topics': {},
+        'last_seen': {},
+    }
 
 class DataStore:
-    def __init__(self):
-        # student_id -> list of attempts (most recent last)
-        self.attempts: Dict[str, List[dict]] = defaultdict(list)
+    def __init__(self, max_attempts_per_student: int = 500):
+        if max_attempts_per_student < 1:
+            raise ValueError("max_attempts_per_student must be >= 1")
+        # student_id -> most recent attempts (most recent last); older ones drop off the front.
+        # this bounds what the rule engine sees: once an attempt is evicted it no longer counts
+        # towards its topic's recent window, and a topic whose attempts are all evicted has no
+        # outcome history at all (last_seen / last_seen_ns still remember it for avoidance)
+        self.max_attempts_per_student = max_attempts_per_student
+        self.attempts: Dict[str, Deque[dict]] = defaultdict(lambda: deque(maxlen=max_attempts_per_student))
+        # student_id -> topic -> the same attempt dicts, in order (index over self.attempts)
+        self.attempts_by_topic: Dict[str, Dict[str, Deque[dict]]] = defaultdict(lambda: defaultdict(deque))
+        # student_id -> topic -> one outcome_code byte per attempt, aligned with attempts_by_topic
+        self.outcomes_by_topic: Dict[str, Dict[str, bytearray]] = defaultdict(lambda: defaultdict(bytearray))
+        # student_id -> topic -> epoch ns of the latest attempt (numeric twin of profile['last_seen'])
+        self.last_seen_ns: Dict[str, Dict[str, int]] = defaultdict(dict)
         # student profiles
         self.profiles: Dict[str, dict] = {}
         # question bank
         self.questions: Dict[str, dict] = {}
+        # called as on_evict(student_id, topic, outcome_code, remaining) after an attempt is trimmed
+        # from its topic; remaining is the topic's outcome count afterwards (set via set_evict_listener)
+        self.on_evict: Optional[Callable[[str, str, int, int], None]] = None
+
+    def set_evict_listener(self, listener: Callable[[str, str, int, int], None]):
+        # one listener only: a RuleEngine keeps derived counts that must see every eviction
+        if self.on_evict is not None:
+            raise ValueError("datastore already has an eviction listener (one RuleEngine per DataStore)")
+        self.on_evict = listener
 
     def add_question_bank(self, questions: list):
         for q in questions:
             self.questions[q['id']] = q
 
-    def record_attempt(self, student_id: str, attempt: dict):
-        attempt = dict(attempt)
-        attempt['ts'] = datetime.utcnow().isoformat()
-        self.attempts[student_id].append(attempt)
-        # ensure profile exists
-        self.profiles.setdefault(student_id, {
-            'xp': 0,
-            'level': 1,
-            'weak_topics': {},
-            'last_seen': {},
-        })
-        self.profiles[student_id]['last_seen'][attempt['topic']] = attempt['ts']
+    def record_attempt(self, student_id: str, attempt: dict, now: Optional[int] = None):
+        # takes ownership of `attempt`: it is stamped and stored as-is, so pass a fresh dict
+        # now: epoch nanoseconds; callers ingesting a batch can share one clock read
+        # once a RuleEngine is attached, record through RuleEngine.process_attempt: its rolling
+        # failure counts are updated per attempt and go stale if attempts bypass it
+        if now is None:
+            now = time.time_ns()
+        # topics key every per-topic dict; interned copies hash once and compare by identity
+        attempt['topic'] = sys.intern(attempt['topic'])
+        attempt['ts'] = ts_to_datetime(now).isoformat()
+        history = self.attempts[student_id]
+        if len(history) == self.max_attempts_per_student:
+            self._evict_oldest(student_id, history[0])
+        history.append(attempt)
+        self.attempts_by_topic[student_id][attempt['topic']].append(attempt)
+        self.outcomes_by_topic[student_id][attempt['topic']].append(outcome_code(attempt['difficulty'], attempt['correct']))
+        self.get_profile(student_id)['last_seen'][attempt['topic']] = attempt['ts']
+        self.last_seen_ns[student_id][attempt['topic']] = now
         return attempt
 
+    def _evict_oldest(self, student_id: str, oldest: dict):
+        # the student's oldest attempt is also the oldest in its topic, so both indexes trim from the front
+        topic = oldest['topic']
+        by_topic = self.attempts_by_topic[student_id]
+        by_topic[topic].popleft()
+        outcomes = self.outcomes_by_topic[student_id][topic]
+        code = outcomes[0]
+        del outcomes[0]
+        if not outcomes:
+            del by_topic[topic]
+            del self.outcomes_by_topic[student_id][topic]
+        if self.on_evict is not None:
+            self.on_evict(student_id, topic, code, len(outcomes))
+
     def get_attempts(self, student_id: str):
-        return list(self.attempts.get(student_id, []))
+        return list(self.attempts.get(student_id, ()))
+
+    def get_outcomes_for_topic(self, student_id: str, topic: str):
+        # live outcome codes (no copy); callers must not mutate them
+        return self.outcomes_by_topic.get(student_id, {}).get(topic, bytearray())
 
     def get_profile(self, student_id: str):
-        return self.profiles.setdefault(student_id, {
-            'xp': 0,
-            'level': 1,
-            'weak_topics': {},
-            'last_seen': {},
-        })
+        # create on first use; the default is only built on a miss
+        profile = self.profiles.get(student_id)
+        if profile is None:
+            profile = self.profiles[student_id] = _new_profile()
+        return profile
@@ -1,3 +1,7 @@
+from bisect import bisect_left
+
+from typing import List
+
 from fastapi import APIRouter
 from pydantic import BaseModel
 
@@ -16,42 +20,49 @@ class PredictResponse(BaseModel):
     confidence: float
     details: dict
 
-@router.post("/", response_model=PredictResponse)
-def predict(req: PredictRequest):
-    """
-    Simple prototype 'model' (heuristic):
-    - if correct and fast => recommend increase_difficulty
-    - if wrong and slow  => recommend decrease_difficulty
-    - otherwise => same difficulty
-    Returns a confidence score between 0.0 and 1.0.
-    """
-    score = 0.0
-    # base from correctness
-    if req.correct:
-        score += 0.6
-    else:
-        score += 0.1
-
-    # faster answers increase confidence
-    if req.time_spent_seconds <= 20:
-        score += 0.25
-    elif req.time_spent_seconds <= 45:
-        score += 0.1
-    elif req.time_spent_seconds >= 90:
-        score -= 0.15
-
-    # clamp
-    score = max(0.0, min(1.0, score))
+# time buckets: <=20s, 21-45s, 46-89s, >=90s
+_TIME_BUCKET_EDGES = (20, 45, 89)
+# faster answers increase confidence
+_TIME_BONUS = (0.25, 0.1, 0.0, -0.15)
+# base score indexed by int(correct)
+_CORRECT_BASE = (0.1, 0.6)
 
+def _outcome(base: float, bonus: float):
+    score = max(0.0, min(1.0, base + bonus))
     if score >= 0.7:
         recommendation = "increase_difficulty"
     elif score <= 0.25:
         recommendation = "decrease_difficulty"
     else:
         recommendation = "same"
+    return recommendation, round(score, 2)
 
+# only 2 x 4 inputs are distinguishable, so every (recommendation, confidence) is precomputed
+_OUTCOMES = tuple(tuple(_outcome(base, bonus) for bonus in _TIME_BONUS) for base in _CORRECT_BASE)
+
+def _respond(req: PredictRequest) -> PredictResponse:
+    recommendation, confidence = _OUTCOMES[req.correct][bisect_left(_TIME_BUCKET_EDGES, req.time_spent_seconds)]
     return PredictResponse(
         recommendation=recommendation,
-        confidence=round(score, 2),
+        confidence=confidence,
         details={"time_spent_seconds": req.time_spent_seconds, "correct": req.correct}
     )
+
+@router.post("/", response_model=PredictResponse)
+def predict(req: PredictRequest):
+    """
+    Simple prototype 'model' (heuristic):
+    - if correct and fast => recommend increase_difficulty
+    - if wrong and slow  => recommend decrease_difficulty
+    - otherwise => same difficulty
+    Returns a confidence score between 0.0 and 1.0.
+    """
+    return _respond(req)
+
+@router.post("/batch", response_model=List[PredictResponse])
+def predict_batch(reqs: List[PredictRequest]):
+    """
+    Same heuristic as predict, for many attempts in one request.
+    Responses are returned in request order.
+    """
+    return [_respond(req) for req in reqs]
@@ -1,7 +1,8 @@
-from collections import defaultdict
-from datetime import datetime, timedelta
-from dateutil import parser
-from typing import Dict, Any, List, Optional
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+from datastore import DIFFICULTY_ORDER, DIFFICULTY_RANK, outcome_code
 
 # Prototype thresholds; tweak as needed
 DEFAULT_CONFIG = {
@@ -12,78 +13,142 @@ DEFAULT_CONFIG = {
     'weekly_xp_threshold': 200,
 }
 
+# weakness detection looks at the last N attempts on a topic
+RECENT_WINDOW = 10
+
+# attempt timestamps are epoch nanoseconds (see DataStore.record_attempt)
+NS_PER_DAY = 86400 * 10**9
+
+# induction pattern as outcome codes: failed hard, failed hard, then medium correct
+FAIL_2_HARD_THEN_MEDIUM = bytes((
+    outcome_code('hard', False),
+    outcome_code('hard', False),
+    outcome_code('medium', True),
+))
+
+@dataclass(slots=True)
+class StreakState:
+    # one per (student, topic); slotted to keep the many small instances compact
+    correct_streak: int = 0
+    wrong_streak: int = 0
+    last_attempt_ts: Optional[str] = None
+    # failures among the last RECENT_WINDOW attempts
+    recent_failures: int = 0
+
+@dataclass(slots=True)
+class NextAction:
+    action: str
+    payload: Dict[str, Any]
+
+@dataclass(slots=True)
+class Decision:
+    # returned by process_attempt; converted to plain dicts only at the JSON boundary
+    student_id: str
+    topic: str
+    attempt: Dict[str, Any]
+    next_action: NextAction
+    xp_gained: int
+    level_up: bool
+    weekly_mission: Optional[Dict[str, Any]]
+
+    def to_dict(self) -> Dict[str, Any]:
+        # shallow: attempt/payload/mission dicts are shared, not copied
+        return {
+            'student_id': self.student_id,
+            'topic': self.topic,
+            'attempt': self.attempt,
+            'next_action': {'action': self.next_action.action, 'payload': self.next_action.payload},
+            'xp_gained': self.xp_gained,
+            'level_up': self.level_up,
+            'weekly_mission': self.weekly_mission
+        }
+
 class RuleEngine:
     def __init__(self, datastore, config=None):
         self.ds = datastore
         self.config = config or DEFAULT_CONFIG
+        # config values read on every attempt, resolved once here
+        self._up = self.config['correct_streak_for_up']
+        self._down = self.config['wrong_streak_for_down']
+        self._xp = self.config['xp_per_correct']
+        self._weekly_xp = self.config['weekly_xp_threshold']
+        # avoidance threshold in the same unit as attempt timestamps
+        self._avoid_ns = self.config['avoid_days_threshold'] * NS_PER_DAY
         # ephemeral per-student per-topic streaks kept in memory for fast decisions
-        # {student_id: {topic: {'correct_streak': int, 'wrong_streak': int, 'last_attempt_ts': str}}}
-        self.streaks: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(lambda: defaultdict(lambda: {
-            'correct_streak': 0,
-            'wrong_streak': 0,
-            'last_attempt_ts': None
-        }))
-
-    def process_attempt(self, student_id: str, attempt: Dict[str, Any]) -> Dict[str, Any]:
+        self.streaks: Dict[Tuple[str, str], StreakState] = {}
+        # keep recent_failures in step when the datastore trims old attempts
+        self.ds.set_evict_listener(self._forget_outcome)
+
+    def _forget_outcome(self, student_id: str, topic: str, code: int, remaining: int):
+        # the evicted attempt was inside the recent window only if fewer than RECENT_WINDOW remain
+        if remaining < RECENT_WINDOW and not code & 1:
+            s = self.streaks.get((student_id, topic))
+            if s is not None:
+                s.recent_failures -= 1
+
+    def process_attempt(self, student_id: str, attempt: Dict[str, Any], now: Optional[int] = None) -> Decision:
         """
         Main entry: record attempt, update profile & streaks, apply rules, return decision.
         attempt keys required: question_id, topic, difficulty (easy/medium/hard), correct (bool), time_spent_seconds
+        The attempt dict is stored as-is (see DataStore.record_attempt); pass a fresh dict.
+        now: optional epoch-nanoseconds timestamp shared across a batch; read from the clock once per attempt otherwise
         """
+        if now is None:
+            now = time.time_ns()
 
         # 1) record attempt in datastore
-        attempt = self.ds.record_attempt(student_id, attempt)
+        attempt = self.ds.record_attempt(student_id, attempt, now)
 
         # 2) update streaks
         topic = attempt['topic']
-        s = self.streaks[student_id][topic]
+        key = (student_id, topic)
+        s = self.streaks.get(key)
+        if s is None:
+            s = self.streaks[key] = StreakState()
         if attempt['correct']:
-            s['correct_streak'] += 1
-            s['wrong_streak'] = 0
+            s.correct_streak += 1
+            s.wrong_streak = 0
         else:
-            s['wrong_streak'] += 1
-            s['correct_streak'] = 0
-        s['last_attempt_ts'] = attempt['ts']
+            s.wrong_streak += 1
+            s.correct_streak = 0
+        s.last_attempt_ts = attempt['ts']
+        # rolling failure count: add the new attempt, drop the one that just left the window
+        outcomes = self.ds.get_outcomes_for_topic(student_id, topic)
+        s.recent_failures += not attempt['correct']
+        if len(outcomes) > RECENT_WINDOW:
+            s.recent_failures -= not outcomes[-RECENT_WINDOW - 1] & 1  # low bit of the outcome code is 'correct'
 
         # 3) difficulty adjustment
         difficulty_action = None
-        if s['correct_streak'] >= self.config['correct_streak_for_up']:
+        if s.correct_streak >= self._up:
             difficulty_action = 'increase'
             # reset streak to avoid repeated increases
-            s['correct_streak'] = 0
-        elif s['wrong_streak'] >= self.config['wrong_streak_for_down']:
+            s.correct_streak = 0
+        elif s.wrong_streak >= self._down:
             difficulty_action = 'decrease'
-            s['wrong_streak'] = 0
+            s.wrong_streak = 0
 
         # 4) weakness detection: mark topic weak if repeated fails overall (simple heuristic)
         profile = self.ds.get_profile(student_id)
-        topic_attempts = [a for a in self.ds.get_attempts(student_id) if a['topic'] == topic]
-        recent_fail_rate = None
-        if topic_attempts:
-            last_n = topic_attempts[-10:]  # look at last up-to 10 attempts
-            failures = sum(1 for a in last_n if not a['correct'])
-            recent_fail_rate = failures / len(last_n)
+        recent_fail_rate = s.recent_failures / min(len(outcomes), RECENT_WINDOW)
         is_weak = False
-        if recent_fail_rate is not None and recent_fail_rate >= 0.6 and len(topic_attempts) >= 3:
+        if recent_fail_rate >= 0.6 and len(outcomes) >= 3:
             is_weak = True
             profile['weak_topics'][topic] = profile['weak_topics'].get(topic, 0) + 1  # counter
         # If student avoids a topic (no attempts in threshold days)
         avoided_topics = []
-        now = datetime.utcnow()
-        for qtopic, ts in profile.get('last_seen', {}).items():
-            try:
-                last = parser.isoparse(ts)
-            except Exception:
-                continue
-            if (now - last).days >= self.config['avoid_days_threshold']:
+        avoid_ns = self._avoid_ns
+        for qtopic, last_ns in self.ds.last_seen_ns.get(student_id, {}).items():
+            if now - last_ns >= avoid_ns:
                 avoided_topics.append(qtopic)
 
         # 5) XP & gamification
-        gained_xp = self.config['xp_per_correct'] if attempt['correct'] else 0
+        gained_xp = self._xp if attempt['correct'] else 0
         profile['xp'] = profile.get('xp', 0) + gained_xp
         level_up = False
-        if profile['xp'] >= self.config['weekly_xp_threshold']:
+        if profile['xp'] >= self._weekly_xp:
             profile['level'] = profile.get('level', 1) + 1
-            profile['xp'] = profile['xp'] - self.config['weekly_xp_threshold']
+            profile['xp'] = profile['xp'] - self._weekly_xp
             level_up = True
 
         # 6) micro-lesson suggestion rules
@@ -105,27 +170,21 @@ class RuleEngine:
             }
 
         # 7) Decide next question selection hint (this is a prototype selection hint)
-        next_action = {}
         if micro_lesson:
-            next_action['action'] = 'show_micro_lesson'
-            next_action['payload'] = micro_lesson
+            next_action = NextAction('show_micro_lesson', micro_lesson)
         elif soft_quiz:
-            next_action['action'] = 'offer_micro_lesson_and_soft_quiz'
-            next_action['payload'] = soft_quiz
+            next_action = NextAction('offer_micro_lesson_and_soft_quiz', soft_quiz)
         elif difficulty_action == 'increase':
-            next_action['action'] = 'increase_difficulty'
-            next_action['payload'] = {'topic': topic, 'new_difficulty_suggestion': self._higher_difficulty(attempt['difficulty'])}
+            next_action = NextAction('increase_difficulty', {'topic': topic, 'new_difficulty_suggestion': self._higher_difficulty(attempt['difficulty'])})
         elif difficulty_action == 'decrease':
-            next_action['action'] = 'decrease_difficulty'
-            next_action['payload'] = {'topic': topic, 'new_difficulty_suggestion': self._lower_difficulty(attempt['difficulty'])}
+            next_action = NextAction('decrease_difficulty', {'topic': topic, 'new_difficulty_suggestion': self._lower_difficulty(attempt['difficulty'])})
         else:
             # default: recommend next questions in same topic with same difficulty, plus a small spacer
-            next_action['action'] = 'next_questions'
-            next_action['payload'] = {
+            next_action = NextAction('next_questions', {
                 'topic': topic,
                 'difficulty': attempt['difficulty'],
                 'suggested_count': 3
-            }
+            })
 
         # 8) Weekly mission & summary
         weekly_mission = None
@@ -136,33 +195,29 @@ class RuleEngine:
             }
 
         # assemble decision object
-        decision = {
-            'student_id': student_id,
-            'topic': topic,
-            'attempt': attempt,
-            'next_action': next_action,
-            'xp_gained': gained_xp,
-            'level_up': level_up,
-            'weekly_mission': weekly_mission
-        }
+        decision = Decision(
+            student_id=student_id,
+            topic=topic,
+            attempt=attempt,
+            next_action=next_action,
+            xp_gained=gained_xp,
+            level_up=level_up,
+            weekly_mission=weekly_mission
+        )
 
         return decision
 
     def _higher_difficulty(self, d: str) -> str:
-        order = ['easy', 'medium', 'hard']
-        try:
-            idx = order.index(d)
-            return order[min(len(order)-1, idx+1)]
-        except ValueError:
+        idx = DIFFICULTY_RANK.get(d)
+        if idx is None:
             return d
+        return DIFFICULTY_ORDER[min(len(DIFFICULTY_ORDER)-1, idx+1)]
 
     def _lower_difficulty(self, d: str) -> str:
-        order = ['easy', 'medium', 'hard']
-        try:
-            idx = order.index(d)
-            return order[max(0, idx-1)]
-        except ValueError:
+        idx = DIFFICULTY_RANK.get(d)
+        if idx is None:
             return d
+        return DIFFICULTY_ORDER[max(0, idx-1)]
 
     # -----------------
     # Supervised helper
@@ -175,33 +230,36 @@ class RuleEngine:
         This is a prototype — treat results as suggestions for human review/A-B tests.
         """
         candidates = []
+        # one proposal per (rule, topic): the first student/attempt window that shows it
+        seen = set()
         # gather all students if not provided
         student_ids = student_id_list or list(self.ds.attempts.keys())
         for sid in student_ids:
-            attempts = self.ds.get_attempts(sid)
-            # group by topic
-            by_topic = defaultdict(list)
-            for a in attempts:
-                by_topic[a['topic']].append(a)
-            for topic, alist in by_topic.items():
-                # look for patterns in sliding windows
-                for i in range(len(alist)-2):
-                    first = alist[i]
-                    second = alist[i+1]
-                    third = alist[i+2]
-                    # simple heuristic: failed 2 hard in row, then medium correct => candidate
-                    if first['difficulty'] == 'hard' and second['difficulty'] == 'hard' and not first['correct'] and not second['correct']:
-                        if third['difficulty'] == 'medium' and third['correct']:
-                            candidates.append({
-                                'rule_proposal': "fail_2_hard_then_medium_help",
-                                'topic': topic,
-                                'evidence_example': [first, second, third],
-                                'reason': 'observed user improved after medium-level revision'
-                            })
-        # deduplicate proposals by topic
-        unique = {}
-        for c in candidates:
-            key = (c['rule_proposal'], c['topic'])
-            if key not in unique:
-                unique[key] = c
-        return list(unique.values())
+            # attempts already grouped by topic in the datastore index; the indexes are live and
+            # other requests may add or evict topics meanwhile, so iterate over a snapshot
+            by_topic = self.ds.attempts_by_topic.get(sid, {})
+            for topic, alist in list(by_topic.items()):
+                key = ("fail_2_hard_then_medium_help", topic)
+                if key in seen:
+                    continue
+                # simple heuristic: failed 2 hard in row, then medium correct => candidate
+                # scan the topic's outcome codes for the 3-byte pattern instead of sliding over attempt dicts
+                i = bytes(self.ds.get_outcomes_for_topic(sid, topic)).find(FAIL_2_HARD_THEN_MEDIUM)
+                if i < 0:
+                    continue
+                # an eviction between the two reads shifts the attempts; re-check the match on one snapshot
+                attempts = list(alist)
+                evidence = attempts[i:i+3]
+                if bytes(outcome_code(a['difficulty'], a['correct']) for a in evidence) != FAIL_2_HARD_THEN_MEDIUM:
+                    i = bytes(outcome_code(a['difficulty'], a['correct']) for a in attempts).find(FAIL_2_HARD_THEN_MEDIUM)
+                    if i < 0:
+                        continue
+                    evidence = attempts[i:i+3]
+                seen.add(key)
+                candidates.append({
+                    'rule_proposal': "fail_2_hard_then_medium_help",
+                    'topic': topic,
+                    'evidence_example': evidence,
+                    'reason': 'observed user improved after medium-level revision'
+                })
+        return candidates
@@ -0,0 +1,47 @@
+import unittest
+
+from datastore import DataStore, outcome_code
+
+
+def make_attempt(topic, difficulty='easy', correct=True):
+    return {'question_id': 'q', 'topic': topic, 'difficulty': difficulty, 'correct': correct, 'time_spent_seconds': 10}
+
+
+class TestBoundedHistory(unittest.TestCase):
+    def test_rejects_non_positive_cap(self):
+        with self.assertRaises(ValueError):
+            DataStore(max_attempts_per_student=0)
+
+    def test_indexes_stay_aligned_across_cap(self):
+        ds = DataStore(max_attempts_per_student=5)
+        topics = ['a', 'a', 'b', 'a', 'c', 'b', 'b', 'a', 'c', 'c', 'b', 'a']
+        for i, topic in enumerate(topics):
+            ds.record_attempt('s1', make_attempt(topic, 'hard' if i % 3 else 'easy', i % 2 == 0))
+
+        history = list(ds.attempts['s1'])
+        self.assertEqual(history, ds.get_attempts('s1'))
+        self.assertEqual(len(history), 5)
+        expected = {}
+        for a in history:
+            expected.setdefault(a['topic'], []).append(a)
+        self.assertEqual(set(ds.attempts_by_topic['s1']), set(expected))
+        self.assertEqual(set(ds.outcomes_by_topic['s1']), set(expected))
+        for topic, alist in expected.items():
+            self.assertEqual(list(ds.attempts_by_topic['s1'][topic]), alist)
+            self.assertEqual(bytes(ds.get_outcomes_for_topic('s1', topic)),
+                             bytes(outcome_code(a['difficulty'], a['correct']) for a in alist))
+
+    def test_fully_evicted_topic_is_dropped_from_indexes(self):
+        ds = DataStore(max_attempts_per_student=2)
+        ds.record_attempt('s1', make_attempt('a'))
+        ds.record_attempt('s1', make_attempt('b'))
+        ds.record_attempt('s1', make_attempt('b'))
+        self.assertNotIn('a', ds.attempts_by_topic['s1'])
+        self.assertNotIn('a', ds.outcomes_by_topic['s1'])
+        self.assertEqual(ds.get_outcomes_for_topic('s1', 'a'), bytearray())
+        # avoidance still sees the topic
+        self.assertIn('a', ds.last_seen_ns['s1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
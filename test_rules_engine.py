@@ -0,0 +1,50 @@
+import random
+import unittest
+
+from datastore import DataStore
+from rules_engine import RECENT_WINDOW, RuleEngine
+from test_datastore import make_attempt
+
+
+class TestRecentFailuresAcrossEviction(unittest.TestCase):
+    def _assert_counts_match_outcomes(self, engine):
+        for (sid, topic), s in engine.streaks.items():
+            window = engine.ds.get_outcomes_for_topic(sid, topic)[-RECENT_WINDOW:]
+            self.assertEqual(s.recent_failures, sum(not c & 1 for c in window), (sid, topic))
+
+    def test_evicted_failures_do_not_mark_topic_weak(self):
+        engine = RuleEngine(DataStore())
+        for _ in range(2):
+            engine.process_attempt('s1', make_attempt('a', correct=False))
+        for _ in range(engine.ds.max_attempts_per_student):
+            engine.process_attempt('s1', make_attempt('b'))
+        for _ in range(3):
+            decision = engine.process_attempt('s1', make_attempt('a'))
+
+        self._assert_counts_match_outcomes(engine)
+        self.assertNotIn('a', engine.ds.get_profile('s1')['weak_topics'])
+        # the two failures on 'a' were evicted, so only the correct streak matters
+        self.assertEqual(decision.next_action.action, 'increase_difficulty')
+
+    def test_counts_match_outcomes_with_small_cap(self):
+        rnd = random.Random(0)
+        engine = RuleEngine(DataStore(max_attempts_per_student=15))
+        for _ in range(2000):
+            engine.process_attempt(rnd.choice(['s1', 's2']),
+                                   make_attempt(rnd.choice(['a', 'b', 'c']), rnd.choice(['easy', 'hard']), rnd.random() < 0.4))
+            self._assert_counts_match_outcomes(engine)
+
+
+    def test_second_engine_on_same_store_is_rejected(self):
+        ds = DataStore(max_attempts_per_student=5)
+        engine = RuleEngine(ds)
+        with self.assertRaises(ValueError):
+            RuleEngine(ds)
+        # the first engine still receives evictions
+        for correct in (False, False, True, True, True, True, True, True):
+            engine.process_attempt('s1', make_attempt('a', correct=correct))
+        self._assert_counts_match_outcomes(engine)
+
+
+if __name__ == '__main__':
+    unittest.main()